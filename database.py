@@ -5,11 +5,11 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -21,12 +21,32 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+def web_concurrency() -> int:
+    """Number of server worker processes, from WEB_CONCURRENCY (1 when unset)"""
+    return max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+WEB_CONCURRENCY = web_concurrency()
+
+# Pool sizes are per process. The totals (100 max, 10 min) are split across
+# WEB_CONCURRENCY workers; override with MONGO_MAX_POOL_SIZE and
+# MONGO_MIN_POOL_SIZE to set the per-worker values explicitly.
+max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", str(max(100 // WEB_CONCURRENCY, 4))))
+min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", str(10 // WEB_CONCURRENCY)))
+
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # Single client per process; its connection pool is shared by all requests
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min(min_pool_size, max_pool_size),
+        serverSelectionTimeoutMS=3000,
+        compressors="zstd,zlib",
+        retryWrites=True,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +60,41 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, data: List[Union[BaseModel, dict]], ordered: bool = False):
+    """Insert several documents with timestamps in a single batch"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for item in data:
+        item_dict = item.model_dump() if isinstance(item, BaseModel) else item.copy()
+        item_dict['created_at'] = now
+        item_dict['updated_at'] = now
+        docs.append(item_dict)
+
+    result = await db[collection_name].insert_many(docs, ordered=ordered)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally restricted to `projection` fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
+
+def date_range_pipeline(start: str, end: str, extra_stages: list = None):
+    """Build an aggregation pipeline that matches on `date` first.
+
+    The $match must stay the first stage so the planner can use the `date`
+    index; a preceding $project/$addFields would force a full collection scan.
+    Dates are stored as YYYY-MM-DD strings, so no conversion is needed.
+    """
+    return [{"$match": {"date": {"$gte": start, "$lte": end}}}, *(extra_stages or [])]
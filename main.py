@@ -1,12 +1,18 @@
+import asyncio
+import logging
 import os
-from datetime import datetime, timedelta
-from typing import List, Optional
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-from database import create_document, get_documents, db
+from database import WEB_CONCURRENCY, create_document, create_documents, get_documents, db, web_concurrency
 from schemas import (
     MenuItem,
     CanteenMenuDay,
@@ -15,27 +21,65 @@ from schemas import (
     PronoteCredentials,
 )
 
-app = FastAPI(title="Lycée Charles de Gaulle API")
+logger = logging.getLogger("uvicorn.error")
+
+async def create_indexes():
+    """Index sur canteenmenuday.date pour les requêtes par plage ($gte/$lte)"""
+    if db is None:
+        return
+    try:
+        # Les dates sont stockées en YYYY-MM-DD: l'ordre lexicographique suit
+        # l'ordre chronologique, le filtre par plage reste un IXSCAN.
+        await db.canteenmenuday.create_index([("date", 1)], name="date_asc")
+    except Exception as e:
+        logger.warning("Index canteenmenuday.date non créé: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_indexes()
+    yield
+
+app = FastAPI(
+    title="Lycée Charles de Gaulle API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
+
+# FRONTEND_URL: origine(s) autorisée(s), séparées par des virgules ("*" par défaut)
+FRONTEND_URLS = [o.strip() for o in os.getenv("FRONTEND_URL", "*").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=FRONTEND_URLS,
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Backend Lycée Charles de Gaulle opérationnel"}
 
 @app.get("/api/hello")
-def hello():
+async def hello():
     return {"message": "Bienvenue sur l'API du Lycée Charles de Gaulle"}
 
+@app.get("/healthz")
+async def healthz():
+    """Sonde légère, sans accès à la base de données"""
+    return {"ok": True}
+
+# Cache de list_collection_names() pour /test: (horodatage, collections)
+_COLLECTIONS_TTL = 30
+_collections_cache: Optional[Tuple[float, List[str]]] = None
+
 @app.get("/test")
-def test_database():
+async def test_database():
     """Test pour vérifier la connexion base de données"""
+    global _collections_cache
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -51,7 +95,11 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                if _collections_cache is not None and time.time() - _collections_cache[0] < _COLLECTIONS_TTL:
+                    collections = _collections_cache[1]
+                else:
+                    collections = await db.list_collection_names()
+                    _collections_cache = (time.time(), collections)
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -77,40 +125,114 @@ class MenuOut(BaseModel):
 
 from bson import ObjectId
 
-def _serialize_menu(doc) -> MenuOut:
-    return MenuOut(
-        id=str(doc.get("_id")),
-        date=doc.get("date"),
-        items=[MenuItem(**item) for item in doc.get("items", [])],
-    )
+_MENU_ITEM_FIELDS = tuple(MenuItem.model_fields)
+
+# Champs lus par _serialize_menu (_id est toujours renvoyé par Mongo)
+_MENU_PROJECTION = {"date": 1, "items": 1}
+
+def _serialize_menu(doc) -> dict:
+    # Les plats ont déjà été validés à l'insertion: on renvoie un dict brut
+    # encodé directement par orjson, sans repasser par MenuOut.
+    # Seuls les champs de MenuItem sont conservés, sans revalidation.
+    return {
+        "id": str(doc.get("_id")),
+        "date": doc.get("date"),
+        "items": [{k: item.get(k) for k in _MENU_ITEM_FIELDS} for item in doc.get("items", [])],
+    }
+
+# Cache du menu du jour (par processus): date -> (expiration, menu sérialisé).
+# L'entrée expire à minuit UTC et est invalidée à chaque écriture sur cette date.
+# L'invalidation ne touche que le worker qui a reçu l'écriture: avec plusieurs
+# workers, la durée de vie est bornée (TODAY_MENU_CACHE_TTL, 60 s par défaut).
+_TODAY_CACHE_TTL = int(os.getenv("TODAY_MENU_CACHE_TTL", "60")) if WEB_CONCURRENCY > 1 else None
+_today_cache: Dict[str, Tuple[float, Optional[dict]]] = {}
+_today_lock = asyncio.Lock()
+# Incrémenté à chaque invalidation: une lecture commencée avant une écriture
+# ne doit pas remettre en cache un résultat devenu obsolète.
+_today_cache_generation = 0
+
+# Date UTC du jour mise en cache: (numéro de jour depuis l'epoch, YYYY-MM-DD)
+_today_str: Tuple[int, str] = (-1, "")
+
+def _utc_today() -> str:
+    global _today_str
+    now = time.time()
+    day = int(now // 86400)
+    if day != _today_str[0]:
+        _today_str = (day, datetime.fromtimestamp(now, tz=timezone.utc).date().isoformat())
+    return _today_str[1]
+
+def _today_cache_expiry(now: float) -> float:
+    midnight = (now // 86400 + 1) * 86400
+    if _TODAY_CACHE_TTL is None:
+        return midnight
+    return min(midnight, now + _TODAY_CACHE_TTL)
+
+def _invalidate_today_cache(dates) -> None:
+    global _today_cache_generation
+    _today_cache_generation += 1
+    for d in dates:
+        _today_cache.pop(d, None)
 
 @app.post("/api/menu", response_model=dict)
-def create_menu_day(payload: MenuCreate):
+async def create_menu_day(payload: MenuCreate):
     """Créer/enregistrer le menu d'un jour (réservé administration)"""
     try:
-        inserted_id = create_document("canteenmenuday", payload)
+        inserted_id = await create_document("canteenmenuday", payload)
+        _invalidate_today_cache([payload.date])
         return {"success": True, "id": inserted_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/menu/bulk", response_model=dict)
+async def create_menu_days(payloads: List[MenuCreate]):
+    """Enregistrer plusieurs jours de menu en une seule insertion (réservé administration)"""
+    if not payloads:
+        return {"success": True, "ids": []}
+    try:
+        try:
+            inserted_ids = await create_documents("canteenmenuday", payloads)
+        finally:
+            # Avec ordered=False une partie du lot peut être écrite malgré une erreur
+            _invalidate_today_cache(p.date for p in payloads)
+        return {"success": True, "ids": inserted_ids}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/menu/today", response_model=Optional[MenuOut])
-def get_today_menu():
+async def get_today_menu():
     """Obtenir le menu d'aujourd'hui"""
     try:
-        today = datetime.utcnow().strftime("%Y-%m-%d")
-        docs = get_documents("canteenmenuday", {"date": today}, limit=1)
-        if not docs:
-            return None
-        return _serialize_menu(docs[0])
+        today = _utc_today()
+        cached = _today_cache.get(today)
+        if cached is not None and cached[0] > time.time():
+            return ORJSONResponse(cached[1])
+        async with _today_lock:
+            # Une autre requête a pu remplir le cache pendant l'attente du verrou
+            cached = _today_cache.get(today)
+            if cached is not None and cached[0] > time.time():
+                return ORJSONResponse(cached[1])
+            generation = _today_cache_generation
+            docs = await get_documents("canteenmenuday", {"date": today}, limit=1, projection=_MENU_PROJECTION)
+            menu = _serialize_menu(docs[0]) if docs else None
+            if generation == _today_cache_generation:
+                _today_cache.clear()
+                _today_cache[today] = (_today_cache_expiry(time.time()), menu)
+        return ORJSONResponse(menu)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/menu", response_model=List[MenuOut])
-def get_menu_range(start: str = Query(..., description="YYYY-MM-DD"), end: str = Query(..., description="YYYY-MM-DD")):
+async def get_menu_range(start: str = Query(..., description="YYYY-MM-DD"), end: str = Query(..., description="YYYY-MM-DD")):
     """Obtenir les menus entre deux dates incluses"""
     try:
-        docs = get_documents("canteenmenuday", {"date": {"$gte": start, "$lte": end}}, limit=100)
-        return [_serialize_menu(d) for d in docs]
+        docs = await get_documents(
+            "canteenmenuday",
+            {"date": {"$gte": start, "$lte": end}},
+            limit=100,
+            projection=_MENU_PROJECTION,
+        )
+        return ORJSONResponse([_serialize_menu(d) for d in docs])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -118,44 +240,49 @@ def get_menu_range(start: str = Query(..., description="YYYY-MM-DD"), end: str =
 # Remarque: Pour une intégration réelle, utiliser la librairie pronotepy côté serveur.
 # Ici, on renvoie des données simulées pour valider le flux bout-en-bout.
 
+# Créneaux (début, fin) de la journée simulée, précalculés en HH:MM
+_SLOTS = (("08:00", "09:30"),)
+_SUBJECTS = ("Maths", "Français", "Physique", "Histoire", "Anglais")
+_ROOMS = ("B201", "A105", "Lab1", "C303", "L001")
+_MAX_TIMETABLE_ENTRIES = 10
+
 class TimetableRequest(PronoteCredentials):
     start: Optional[str] = None  # YYYY-MM-DD
     end: Optional[str] = None
 
 @app.post("/api/pronote/timetable", response_model=List[TimetableEntry])
-def get_pronote_timetable(req: TimetableRequest):
+async def get_pronote_timetable(req: TimetableRequest):
     """Récupère l'emploi du temps via Pronote (simulation)"""
     try:
         # Simulation: on génère 5 cours entre les dates demandées
-        start_date = datetime.utcnow().date()
+        start_date = datetime.now(timezone.utc).date()
         end_date = start_date
         if req.start:
-            start_date = datetime.strptime(req.start, "%Y-%m-%d").date()
+            start_date = date.fromisoformat(req.start)
         if req.end:
-            end_date = datetime.strptime(req.end, "%Y-%m-%d").date()
+            end_date = date.fromisoformat(req.end)
         if end_date < start_date:
             end_date = start_date
         results: List[TimetableEntry] = []
-        cur = start_date
-        subjects = ["Maths", "Français", "Physique", "Histoire", "Anglais"]
-        rooms = ["B201", "A105", "Lab1", "C303", "L001"]
+        n_days = min((end_date - start_date).days + 1, _MAX_TIMETABLE_ENTRIES)
         i = 0
-        while cur <= end_date and i < 10:
-            start_t = datetime.combine(cur, datetime.strptime("08:00", "%H:%M").time())
-            end_t = start_t + timedelta(hours=1, minutes=30)
-            results.append(
-                TimetableEntry(
-                    date=cur.strftime("%Y-%m-%d"),
-                    start=start_t.strftime("%H:%M"),
-                    end=end_t.strftime("%H:%M"),
-                    subject=subjects[i % len(subjects)],
-                    room=rooms[i % len(rooms)],
-                    teacher="M./Mme X",
-                    group="2nde A",
+        for offset in range(n_days):
+            day = (start_date + timedelta(days=offset)).isoformat()
+            for slot_start, slot_end in _SLOTS:
+                results.append(
+                    TimetableEntry.model_construct(
+                        date=day,
+                        start=slot_start,
+                        end=slot_end,
+                        subject=_SUBJECTS[i % len(_SUBJECTS)],
+                        room=_ROOMS[i % len(_ROOMS)],
+                        teacher="M./Mme X",
+                        group="2nde A",
+                    )
                 )
-            )
-            cur += timedelta(days=1)
-            i += 1
+                i += 1
+                if i >= _MAX_TIMETABLE_ENTRIES:
+                    return results
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -165,16 +292,16 @@ class AbsencesRequest(PronoteCredentials):
     end: Optional[str] = None
 
 @app.post("/api/pronote/absences", response_model=List[AbsenceRecord])
-def get_pronote_absences(req: AbsencesRequest):
+async def get_pronote_absences(req: AbsencesRequest):
     """Récupère les absences via Pronote (simulation)"""
     try:
         # Simulation: 0 ou 1 absence aléatoire sur la période
-        start_date = datetime.utcnow().date()
+        start_date = datetime.now(timezone.utc).date()
         if req.start:
-            start_date = datetime.strptime(req.start, "%Y-%m-%d").date()
-        absence_day = start_date.strftime("%Y-%m-%d")
+            start_date = date.fromisoformat(req.start)
+        absence_day = start_date.isoformat()
         return [
-            AbsenceRecord(
+            AbsenceRecord.model_construct(
                 date=absence_day,
                 start="10:00",
                 end="12:00",
@@ -188,4 +315,18 @@ def get_pronote_absences(req: AbsencesRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Un processus par cœur par défaut. WEB_CONCURRENCY est exporté avant le
+    # lancement: les workers en héritent et calculent la même taille de pool
+    # Mongo et le même TTL du cache du menu du jour (voir _TODAY_CACHE_TTL).
+    # En production (gunicorn -k uvicorn.workers.UvicornWorker -w N main:app,
+    # ou la CLI uvicorn --workers N), exporter WEB_CONCURRENCY=N: sinon chaque
+    # worker se croit seul.
+    os.environ.setdefault("WEB_CONCURRENCY", str(os.cpu_count() or 1))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=web_concurrency(),
+    )